@@ -1,16 +1,32 @@
-from abc import ABC, abstractmethod
+from typing import Protocol
 
 
-class BaseLimiter(ABC):
+class BaseLimiter(Protocol):
+    """
+    Structural interface shared by all rate limiters.
+    Limiters satisfy it by implementing these methods; they do not inherit from it.
+    The dashboard and UI annotate their limiter parameters with it.
+    Window limiters accept cost for compatibility and count every request once.
+    """
 
-    @abstractmethod
-    def is_allowed(self, client_id: str, cost: int = 1):
-        pass
+    def is_allowed(self, client_id: str, cost: int = 1) -> tuple[bool, dict]:
+        ...
 
-    @abstractmethod
-    def get_status(self):
-        pass
+    def is_allowed_batch(self, requests: list[tuple[str, int]]) -> list[tuple[bool, dict]]:
+        """
+        Check several (client_id, cost) requests in order with one Redis round-trip.
+        """
+        ...
 
-    @abstractmethod
-    def reset(self):
-        pass
+    def get_status(self) -> dict:
+        """
+        Window-based limiters include current_count, max_requests, remaining,
+        time_remaining and window_size; the dashboard reads these keys directly.
+        """
+        ...
+
+    def get_history(self, limit: int = 20) -> list[dict]:
+        ...
+
+    def reset(self) -> None:
+        ...
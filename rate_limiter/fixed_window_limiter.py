@@ -1,11 +1,52 @@
-import redis
+import hashlib
+import os
 import time
-import json
-from datetime import datetime
-from base_limiter import BaseLimiter
 
+from redis_pool import format_time, get_pool, run_script
 
-class FixedWindowRateLimiter(BaseLimiter):
+
+# Server-side allow/deny + history append, executed atomically in one round-trip.
+# History is a capped stream of typed fields, so no JSON is involved.
+# Rejected requests are only recorded when record_reject is 1 and the
+# count is still below twice the limit. Unless count_rejects is 1, a rejected
+# request is rolled back so the stored counter never exceeds max_requests.
+# New window keys are indexed in a sorted set scored by expiry time (ms), so
+# reset() can find them without scanning the keyspace. The index TTL is only
+# ever extended, so a short window cannot expire it while longer ones are live.
+# KEYS: [window_key, history_key, index_key]
+# ARGV: [window_ttl_ms, max_requests, client_id, timestamp, record_reject, count_rejects, history_cap]
+_IS_ALLOWED_LUA = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('PEXPIRE', KEYS[1], ARGV[1])
+    local now_ms = math.floor(tonumber(ARGV[4]) * 1000)
+    redis.call('ZADD', KEYS[3], now_ms + tonumber(ARGV[1]), KEYS[1])
+    redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now_ms)
+    if redis.call('PTTL', KEYS[3]) < tonumber(ARGV[1]) then
+        redis.call('PEXPIRE', KEYS[3], ARGV[1])
+    end
+end
+local max_requests = tonumber(ARGV[2])
+local allowed = count <= max_requests
+if not allowed and ARGV[6] == '0' then
+    redis.call('DECR', KEYS[1])
+end
+if allowed or (ARGV[5] == '1' and count <= 2 * max_requests) then
+    redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[7], '*',
+        'u', ARGV[3],
+        's', allowed and 1 or 0,
+        'c', count,
+        'w', count == 1 and 1 or 0,
+        't', ARGV[4])
+end
+return {count, allowed and 1 or 0}
+"""
+
+# EVALSHA digest of the script, shared by all instances; loaded on first NOSCRIPT
+_IS_ALLOWED_SHA = hashlib.sha1(_IS_ALLOWED_LUA.encode()).hexdigest()
+
+
+class FixedWindowRateLimiter:
     """
     Fixed Window Rate Limiter implementation using Redis.
     Divides time into fixed windows and limits requests per window.
@@ -15,147 +56,453 @@ class FixedWindowRateLimiter(BaseLimiter):
     - Time is divided into non-overlapping windows of fixed size
     - Each window has an independent request counter
     - Counter resets to 0 when window expires
+
+    Thread-safety is delegated to Redis: the counter update and history
+    append run atomically in a Lua script, so is_allowed must not be
+    wrapped in a Python lock.
+
+    History is approximate under overload: only one in REJECT_SAMPLE_RATE
+    rejected requests is recorded, and none once the window count exceeds
+    twice the limit.
     """
 
-    def __init__(self, max_requests, window_size, redis_client=None):
+    # Record one in this many rejected requests in history
+    REJECT_SAMPLE_RATE = 10
+
+    # Approximate number of history records kept in the stream
+    HISTORY_SIZE = 50
+
+    def __init__(self, max_requests, window_size, redis_client=None, count_rejects=False, per_client=False,
+                 connection_pool=None):
         """
         Initialize the fixed window rate limiter.
         :param max_requests: Maximum number of requests allowed per window.
         :param window_size: Size of the time window in seconds.
         :param redis_client: Redis client instance (optional).
+        :param count_rejects: Whether rejected requests count toward the window quota.
+        :param per_client: Give each client its own quota instead of one global quota.
+        :param connection_pool: Redis connection pool to use when no client is given
+            (defaults to the shared module pool).
         """
         self.max_requests = max_requests
         self.window_size = window_size
-        self.history_key = "fixed_window_history"
-        self.redis_client = redis_client or redis.Redis(
-            host='redis',
-            port=6379,
-            db=0,
-            decode_responses=True
-        )
+        self.count_rejects = count_rejects
+        self.per_client = per_client
+        self.history_key = "fixed_window_history_stream"
+        self.index_key = "fixed_window_index"
+        self.redis_client = redis_client if redis_client is not None else self._connect(connection_pool)
+
+        # Rejections seen by this instance, used to sample rejects into history
+        self._reject_counter = 0
 
-    def is_allowed(self, client_id):
+        # (window_start, key) of the global-mode counter, replaced as a whole
+        # when the window changes so concurrent readers never see a mixed pair
+        self._cached_window = (None, None)
+
+    def _connect(self, connection_pool):
+        """
+        Create the Redis client used when none is passed in.
+        :param connection_pool: Connection pool to use, or None for the shared module pool.
+        :return: redis.Redis instance.
+        """
+        import redis
+
+        return redis.Redis(connection_pool=connection_pool or get_pool())
+
+    @property
+    def max_requests(self):
+        """
+        Maximum number of requests allowed per window.
+        """
+        return self._max_requests
+
+    @max_requests.setter
+    def max_requests(self, max_requests):
+        """
+        Set the request limit, stored as an int once so per-request
+        comparisons and script arguments need no conversion.
+        :param max_requests: Maximum number of requests allowed per window.
+        """
+        self._max_requests = int(max_requests)
+
+    @property
+    def window_size(self):
+        """
+        Size of the time window in seconds.
+        """
+        return self._window_size
+
+    @window_size.setter
+    def window_size(self, window_size):
+        """
+        Set the window size and cache the values derived from it,
+        so is_allowed does not recompute them on every request.
+        :param window_size: Size of the time window in seconds.
+        """
+        self._window_size = window_size
+        self._win_ns = int(window_size * 1_000_000_000)
+
+    def _window_start(self, now_ns):
+        """
+        Get the start time of the window containing now_ns.
+        Uses integer arithmetic on the wall clock; a monotonic clock cannot be
+        used because window keys are shared by every process using Redis.
+        :param now_ns: Unix timestamp in nanoseconds (time.time_ns()).
+        :return: Window start timestamp in seconds.
+        """
+        return (now_ns // self._win_ns) * self._window_size
+
+    def _window_key(self, window_start, client_id):
+        """
+        Get the Redis counter key for a window.
+        In per-client mode each client has its own counter per window;
+        in global mode the key is cached until the window changes.
+        :param window_start: Window start timestamp in seconds.
+        :param client_id: Client identifier (ignored in global mode).
+        :return: Redis key string.
+        """
+        if self.per_client:
+            return f"fixed_window:{client_id}:{window_start}"
+        cached_start, cached_key = self._cached_window
+        if cached_start == window_start:
+            return cached_key
+        key = f"fixed_window:{window_start}"
+        self._cached_window = (window_start, key)
+        return key
+
+    def is_allowed(self, client_id, cost=1):
         """
         Check if a request is allowed.
+        See check_and_status() for the algorithm.
+
+        :param client_id: The client identifier (quota owner in per-client mode).
+        :param cost: Ignored; every request counts once toward the window.
+        :return: Tuple (allowed: bool, info: dict with window_reset flag).
+        """
+        allowed, info, _ = self.check_and_status(client_id)
+        return allowed, info
+
+    def check_and_status(self, client_id):
+        """
+        Check if a request is allowed and return the resulting status,
+        both from a single Redis round-trip.
         Algorithm:
         1. Calculate current window start time
-        2. Use Redis atomic operations to increment counter
-        3. Set expiration to auto-cleanup old windows
-        4. Check if request count exceeds limit
+        2. Run a Lua script that atomically increments the counter,
+           sets millisecond expiration to the window end on the first request,
+           and appends the request to history (rejects are sampled)
+        3. Check if request count exceeds limit
 
-        :param client_id: The client identifier for logging purposes.
-        :return: Tuple (allowed: bool, info: dict with window_reset flag).
+        :param client_id: The client identifier (quota owner in per-client mode).
+        :return: Tuple (allowed: bool, info: dict with window_reset flag, status: dict like get_status()).
+        """
+        now_ns, window_key, args = self._build_args(client_id)
+
+        # Single round-trip: INCR + PEXPIRE + XADD run atomically on the server
+        current_count, allowed = run_script(self.redis_client, _IS_ALLOWED_SHA, _IS_ALLOWED_LUA,
+                                            (window_key, self.history_key, self.index_key), args)
+        return self._apply_result(now_ns, client_id, current_count, allowed)
+
+    def _build_args(self, client_id):
+        """
+        Build the is_allowed script call for a single request.
+        :param client_id: The client identifier.
+        :return: Tuple (now_ns, window_key, script arguments).
+        """
+        now_ns = time.time_ns()
+        window_key = self._window_key(self._window_start(now_ns), client_id)
+        return now_ns, window_key, self._script_args(now_ns, client_id)
+
+    def is_allowed_batch(self, requests):
+        """
+        Check several requests, in order, with a single pipelined round-trip.
+        Each request runs the is_allowed script as in check_and_status().
+        :param requests: Iterable of (client_id, cost) tuples; cost is ignored,
+                         every request counts once toward the window.
+        :return: List of (allowed: bool, info: dict with window_reset flag) tuples in request order.
         """
-        current_time = time.time()
-        current_window_start = int(current_time // self.window_size) * self.window_size
-        window_key = f"fixed_window:{current_window_start}"
+        now_ns = time.time_ns()
+        calls = self._batch_calls(now_ns, requests)
+        results = self._run_script_batch([(window_key, args) for window_key, _, args in calls])
+        return self._apply_batch(now_ns, calls, results)
+
+    def _batch_calls(self, now_ns, requests):
+        """
+        Build the script calls for is_allowed_batch().
+        :param now_ns: Request time in nanoseconds.
+        :param requests: Iterable of (client_id, cost) tuples.
+        :return: List of (window_key, client_id, args) tuples.
+        """
+        calls = []
+        # Outcomes are not known yet, so every request advances the sampling
+        # counter as a potential reject (allowed requests are always recorded)
+        reject_counter = self._reject_counter
+        for client_id, _ in requests:
+            window_key = self._window_key(self._window_start(now_ns), client_id)
+            calls.append((window_key, client_id, self._script_args(now_ns, client_id, reject_counter)))
+            reject_counter += 1
+        return calls
+
+    def _apply_batch(self, now_ns, calls, results):
+        """
+        Apply the script results of is_allowed_batch() in request order.
+        :param now_ns: Request time in nanoseconds.
+        :param calls: Calls built by _batch_calls().
+        :param results: Script results, one per call.
+        :return: List of (allowed: bool, info: dict with window_reset flag) tuples.
+        """
+        batch = []
+        for (_, client_id, _), (current_count, allowed) in zip(calls, results):
+            allowed, info, _ = self._apply_result(now_ns, client_id, current_count, allowed)
+            batch.append((allowed, info))
+        return batch
+
+    def _script_args(self, now_ns, client_id, reject_counter=None):
+        """
+        Build the is_allowed script arguments for a request.
+        :param now_ns: Request time in nanoseconds.
+        :param client_id: The client identifier.
+        :param reject_counter: Rejects seen before this request (defaults to the instance counter).
+        :return: Tuple (ttl_ms, max_requests, client_id, timestamp, record_reject, count_rejects, history_cap).
+        """
+        if reject_counter is None:
+            reject_counter = self._reject_counter
+
+        # Counter expires exactly at the end of its window (at least 1 ms)
+        ttl_ms = max(1, (self._win_ns - now_ns % self._win_ns) // 1_000_000)
 
-        # Atomic Redis operations using pipeline
-        pipe = self.redis_client.pipeline()
-        pipe.incr(window_key)  # Increment counter (creates key if not exists)
-        pipe.expire(window_key, int(self.window_size) + 1)  # Auto-cleanup after window
-        results = pipe.execute()
+        return (
+            ttl_ms,
+            self.max_requests,
+            client_id,
+            now_ns / 1e9,  # History timestamp
+            1 if reject_counter % self.REJECT_SAMPLE_RATE == 0 else 0,
+            1 if self.count_rejects else 0,
+            self.HISTORY_SIZE
+        )
 
-        current_count = results[0]
-        allowed = current_count <= self.max_requests
+    def _apply_result(self, now_ns, client_id, current_count, allowed):
+        """
+        Update local state from a script result and build the check_and_status() return value.
+        :param now_ns: Request time in nanoseconds.
+        :param client_id: The client identifier.
+        :param current_count: Count returned by the script.
+        :param allowed: Whether the script allowed the request.
+        :return: Tuple (allowed: bool, info: dict with window_reset flag, status: dict like get_status()).
+        """
+        if not allowed:
+            self._reject_counter += 1
         window_reset = current_count == 1  # First request in new window
 
-        # Record request history
-        self._add_history_to_redis(client_id, allowed, current_count, window_reset)
+        # A rejected request is rolled back unless rejects are counted
+        stored_count = current_count if allowed or self.count_rejects else current_count - 1
 
-        return allowed, {'window_reset': window_reset}
+        return bool(allowed), {'window_reset': window_reset}, self._build_status(stored_count, now_ns)
 
-    def _add_history_to_redis(self, client_id, allowed, count, window_reset):
+    def _run_script_batch(self, calls):
         """
-        Add request history to shared Redis storage.
-        :param client_id: Client identifier.
-        :param allowed: Whether request was allowed.
-        :param count: Current request count in window.
-        :param window_reset: Whether this is a new window.
-        """
-        history_record = {
-            'time': datetime.now().strftime('%H:%M:%S'),
-            'user': client_id,
-            'status': '成功' if allowed else '拒絕',
-            'count_after': count,
-            'window_reset': window_reset,
-            'timestamp': time.time(),
-            'algorithm': 'fixed_window'
-        }
+        Execute the is_allowed Lua script for several requests in one pipeline.
+        On NOSCRIPT none of the calls ran, so the script is loaded once and
+        the whole pipeline retried.
+        :param calls: List of (window_key, args) tuples, args as built by _script_args().
+        :return: List of [current_count, allowed] results in call order.
+        """
+        try:
+            return self._script_pipeline(calls).execute()
+        except Exception as exc:
+            from redis.exceptions import NoScriptError
 
-        # Add to Redis list (newest first)
-        self.redis_client.lpush(self.history_key, json.dumps(history_record))
+            if not isinstance(exc, NoScriptError):
+                raise
+        self.redis_client.script_load(_IS_ALLOWED_LUA)
+        return self._script_pipeline(calls).execute()
 
-        # Keep only recent 50 records
-        self.redis_client.ltrim(self.history_key, 0, 49)
+    def _script_pipeline(self, calls):
+        """
+        Queue is_allowed script calls on a non-transactional pipeline.
+        :param calls: List of (window_key, args) tuples.
+        :return: Pipeline ready to execute.
+        """
+        pipe = self.redis_client.pipeline(transaction=False)
+        for window_key, args in calls:
+            pipe.evalsha(_IS_ALLOWED_SHA, 3, window_key, self.history_key, self.index_key, *args)
+        return pipe
 
     @property
     def request_history(self):
         """
-        Get shared request history from Redis.
-        :return: List of recent request records.
+        Get shared request history from the Redis stream.
+        :return: List of the 20 most recent request records, newest first.
+        """
+        return self.get_history()
+
+    def get_history(self, limit=20):
+        """
+        Get the most recent request records from the Redis stream.
+        :param limit: Maximum number of records to fetch.
+        :return: List of recent request records, newest first.
+        """
+        entries = self.redis_client.xrevrange(self.history_key, count=limit)
+        return self._parse_history(entries)
+
+    def _parse_history(self, entries):
+        """
+        Convert history stream entries into request records.
+        :param entries: XREVRANGE result, list of (entry_id, fields).
+        :return: List of request records.
         """
-        history_data = self.redis_client.lrange(self.history_key, 0, 19)  # Recent 20 records
         history_list = []
 
-        for record_json in history_data:
-            try:
-                record = json.loads(record_json)
-                history_list.append(record)
-            except json.JSONDecodeError:
-                continue
+        for _, fields in entries:
+            timestamp = float(fields['t'])
+            history_list.append({
+                'time': format_time(timestamp),
+                'user': fields['u'],
+                'status': '成功' if fields['s'] == '1' else '拒絕',
+                'count_after': int(fields['c']),
+                'window_reset': fields['w'] == '1',
+                'timestamp': timestamp,
+                'algorithm': 'fixed_window'
+            })
 
         return history_list
 
-    def get_status(self):
+    def get_status(self, client_id=None):
         """
         Get current rate limiter status.
+        :param client_id: Client to report on; required in per-client mode.
         :return: Dictionary containing current status information.
         """
-        current_time = time.time()
-        current_window_start = int(current_time // self.window_size) * self.window_size
-        window_key = f"fixed_window:{current_window_start}"
+        now_ns, window_key = self._status_key(client_id)
 
         # Get current count from Redis
-        current_count_str = self.redis_client.get(window_key)
-        current_count = int(current_count_str) if current_count_str else 0
+        return self._build_status(self.redis_client.get(window_key), now_ns)
+
+    def _status_key(self, client_id):
+        """
+        Get the counter key a status read is taken from.
+        :param client_id: Client to report on; required in per-client mode.
+        :return: Tuple (now_ns, window_key).
+        """
+        if self.per_client and client_id is None:
+            raise ValueError("client_id is required when per_client is enabled")
+
+        now_ns = time.time_ns()
+        return now_ns, self._window_key(self._window_start(now_ns), client_id)
+
+    def _build_status(self, current_count, now_ns):
+        """
+        Build a status dictionary from a window count.
+        :param current_count: Request count stored in the current window, as an int
+                              or the raw GET result (None if the window has no counter).
+        :param now_ns: Time the count was read, in nanoseconds.
+        :return: Dictionary containing current status information.
+        """
+        current_count = int(current_count or 0)
 
         # Calculate remaining time in current window
-        window_end = current_window_start + self.window_size
-        time_remaining = max(0, window_end - current_time)
+        time_remaining = (self._win_ns - now_ns % self._win_ns) / 1e9
 
         return {
             'current_count': current_count,
             'max_requests': self.max_requests,
             'remaining': max(0, self.max_requests - current_count),
             'time_remaining': time_remaining,
+            'window_size': self.window_size,
             'algorithm': 'Fixed Window'
         }
 
+    def get_dashboard(self, client_id=None, limit=20):
+        """
+        Get status and recent history together in one pipelined round-trip.
+        :param client_id: Client to report on; required in per-client mode.
+        :param limit: Maximum number of history records to fetch.
+        :return: Tuple (status: dict like get_status(), history: list like request_history).
+        """
+        now_ns, pipe = self._dashboard_pipeline(client_id, limit)
+        return self._parse_dashboard(now_ns, pipe.execute())
+
+    def _dashboard_pipeline(self, client_id, limit):
+        """
+        Queue the status and history reads of get_dashboard() on a non-transactional pipeline.
+        :param client_id: Client to report on; required in per-client mode.
+        :param limit: Maximum number of history records to fetch.
+        :return: Tuple (now_ns, pipeline ready to execute).
+        """
+        now_ns, window_key = self._status_key(client_id)
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.get(window_key)
+        pipe.xrevrange(self.history_key, count=limit)
+        return now_ns, pipe
+
+    def _parse_dashboard(self, now_ns, results):
+        """
+        Convert the get_dashboard() pipeline results into status and history.
+        :param now_ns: Time the pipeline was built, in nanoseconds.
+        :param results: Pipeline results [GET result, XREVRANGE result].
+        :return: Tuple (status: dict like get_status(), history: list like request_history).
+        """
+        current_count_str, entries = results
+        return self._build_status(current_count_str, now_ns), self._parse_history(entries)
+
+    def get_client_status(self, client_id):
+        """
+        Get status of a single client's quota.
+        :param client_id: Client identifier.
+        :return: Same as get_status(client_id); the global status in global mode.
+        """
+        return self.get_status(client_id if self.per_client else None)
+
     def reset(self):
         """
         Reset rate limiter state by clearing all data.
         This removes all window counters and history records.
+
+        Live window keys are read from the index kept by the Lua script, so
+        the cost is O(active windows) rather than a SCAN of the keyspace.
+        They are removed with UNLINK in batches, so the server reclaims
+        memory without blocking. In global mode the current window counter
+        is always removed as well, even if the index lost it.
+        """
+        keys = self.redis_client.zrange(self.index_key, 0, -1)
+        self._reset_pipeline(keys).execute()
+
+    def _reset_pipeline(self, keys):
+        """
+        Queue the UNLINK calls of reset() on a non-transactional pipeline.
+        :param keys: Window keys read from the index.
+        :return: Pipeline ready to execute.
         """
-        # Clear history
-        self.redis_client.delete(self.history_key)
+        pipe = self.redis_client.pipeline(transaction=False)
+
+        # UNLINK window keys 500 at a time, then the index and history
+        for i in range(0, len(keys), 500):
+            pipe.unlink(*keys[i:i + 500])
+        pipe.unlink(self.index_key, self.history_key, *self._current_window_keys())
+        return pipe
 
-        # Clear current window counter
-        current_time = time.time()
-        current_window_start = int(current_time // self.window_size) * self.window_size
-        window_key = f"fixed_window:{current_window_start}"
-        self.redis_client.delete(window_key)
+    def _current_window_keys(self):
+        """
+        Get the counter keys of the current window that reset() removes
+        regardless of the index.
+        :return: List with the global window key, or empty in per-client mode
+                 (client keys are only known through the index).
+        """
+        if self.per_client:
+            return []
+        return [self._window_key(self._window_start(time.time_ns()), None)]
 
     def get_window_info(self):
         """
         Get detailed information about current time window.
         :return: Dictionary with window timing information.
         """
-        current_time = time.time()
-        current_window_start = int(current_time // self.window_size) * self.window_size
+        now_ns = time.time_ns()
+        current_window_start = self._window_start(now_ns)
         window_end = current_window_start + self.window_size
-        time_remaining = max(0, window_end - current_time)
-        time_elapsed = current_time - current_window_start
+        time_elapsed = (now_ns % self._win_ns) / 1e9
+        time_remaining = self.window_size - time_elapsed
 
         return {
             'window_start': current_window_start,
@@ -165,3 +512,156 @@ class FixedWindowRateLimiter(BaseLimiter):
             'time_remaining': time_remaining,
             'progress_percentage': (time_elapsed / self.window_size) * 100
         }
+
+
+class AsyncFixedWindowRateLimiter(FixedWindowRateLimiter):
+    """
+    asyncio variant of FixedWindowRateLimiter built on redis.asyncio.
+    Concurrent is_allowed calls (e.g. via asyncio.gather) overlap their
+    round-trips instead of each blocking a thread.
+
+    Methods that talk to Redis are coroutines, including request_history and
+    get_client_status, which are plain methods here rather than a property
+    and a sync wrapper. Counters, history and the Lua script are shared with the
+    synchronous limiter, so both can serve the same quota.
+
+    asyncio connections belong to the event loop that created them, so each
+    instance gets its own client unless redis_client or connection_pool is given.
+    """
+
+    def _connect(self, connection_pool):
+        """
+        Create the asyncio Redis client used when none is passed in.
+        :param connection_pool: redis.asyncio connection pool to use, or None to build one from REDIS_URL.
+        :return: redis.asyncio.Redis instance.
+        """
+        import redis.asyncio as aioredis
+
+        if connection_pool is not None:
+            return aioredis.Redis(connection_pool=connection_pool)
+        return aioredis.Redis.from_url(
+            os.getenv('REDIS_URL', 'redis://redis:6379/0'),
+            max_connections=32,
+            socket_keepalive=True,
+            health_check_interval=30,
+            decode_responses=True
+        )
+
+    async def is_allowed(self, client_id, cost=1):
+        """
+        Check if a request is allowed.
+        :param client_id: The client identifier (quota owner in per-client mode).
+        :param cost: Ignored; every request counts once toward the window.
+        :return: Tuple (allowed: bool, info: dict with window_reset flag).
+        """
+        allowed, info, _ = await self.check_and_status(client_id)
+        return allowed, info
+
+    async def check_and_status(self, client_id):
+        """
+        Check if a request is allowed and return the resulting status.
+        See FixedWindowRateLimiter.check_and_status().
+        :param client_id: The client identifier (quota owner in per-client mode).
+        :return: Tuple (allowed: bool, info: dict with window_reset flag, status: dict like get_status()).
+        """
+        now_ns, window_key, args = self._build_args(client_id)
+        current_count, allowed = await self._run_script(window_key, *args)
+        return self._apply_result(now_ns, client_id, current_count, allowed)
+
+    async def is_allowed_batch(self, requests):
+        """
+        Check several requests, in order, with a single pipelined round-trip.
+        See FixedWindowRateLimiter.is_allowed_batch().
+        :param requests: Iterable of (client_id, cost) tuples; cost is ignored.
+        :return: List of (allowed: bool, info: dict with window_reset flag) tuples in request order.
+        """
+        now_ns = time.time_ns()
+        calls = self._batch_calls(now_ns, requests)
+        results = await self._run_script_batch([(window_key, args) for window_key, _, args in calls])
+        return self._apply_batch(now_ns, calls, results)
+
+    async def _run_script(self, window_key, *args):
+        """
+        Execute the is_allowed Lua script via EVALSHA, loading it on NOSCRIPT.
+        :param window_key: Redis key of the current window counter.
+        :param args: Script arguments, as built by _script_args().
+        :return: List [current_count, allowed].
+        """
+        from redis.exceptions import NoScriptError
+
+        keys = (window_key, self.history_key, self.index_key)
+        try:
+            return await self.redis_client.evalsha(_IS_ALLOWED_SHA, 3, *keys, *args)
+        except NoScriptError:
+            await self.redis_client.script_load(_IS_ALLOWED_LUA)
+        return await self.redis_client.evalsha(_IS_ALLOWED_SHA, 3, *keys, *args)
+
+    async def _run_script_batch(self, calls):
+        """
+        Execute the is_allowed Lua script for several requests in one pipeline, loading it on NOSCRIPT.
+        :param calls: List of (window_key, args) tuples, args as built by _script_args().
+        :return: List of [current_count, allowed] results in call order.
+        """
+        from redis.exceptions import NoScriptError
+
+        try:
+            return await self._script_pipeline(calls).execute()
+        except NoScriptError:
+            await self.redis_client.script_load(_IS_ALLOWED_LUA)
+        return await self._script_pipeline(calls).execute()
+
+    async def request_history(self):
+        """
+        Get shared request history from the Redis stream.
+        :return: List of the 20 most recent request records, newest first.
+        """
+        return await self.get_history()
+
+    async def get_history(self, limit=20):
+        """
+        Get the most recent request records from the Redis stream.
+        :param limit: Maximum number of records to fetch.
+        :return: List of recent request records, newest first.
+        """
+        entries = await self.redis_client.xrevrange(self.history_key, count=limit)
+        return self._parse_history(entries)
+
+    async def get_status(self, client_id=None):
+        """
+        Get current rate limiter status.
+        :param client_id: Client to report on; required in per-client mode.
+        :return: Dictionary containing current status information.
+        """
+        now_ns, window_key = self._status_key(client_id)
+        return self._build_status(await self.redis_client.get(window_key), now_ns)
+
+    async def get_dashboard(self, client_id=None, limit=20):
+        """
+        Get status and recent history together in one pipelined round-trip.
+        :param client_id: Client to report on; required in per-client mode.
+        :param limit: Maximum number of history records to fetch.
+        :return: Tuple (status: dict like get_status(), history: list like request_history).
+        """
+        now_ns, pipe = self._dashboard_pipeline(client_id, limit)
+        return self._parse_dashboard(now_ns, await pipe.execute())
+
+    async def get_client_status(self, client_id):
+        """
+        Get status of a single client's quota.
+        :param client_id: Client identifier.
+        :return: Same as get_status(client_id); the global status in global mode.
+        """
+        return await self.get_status(client_id if self.per_client else None)
+
+    async def reset(self):
+        """
+        Reset rate limiter state by clearing all indexed window counters and history.
+        """
+        keys = await self.redis_client.zrange(self.index_key, 0, -1)
+        await self._reset_pipeline(keys).execute()
+
+    async def aclose(self):
+        """
+        Close the Redis client and its connections.
+        """
+        await self.redis_client.aclose()
@@ -1,11 +1,74 @@
+import hashlib
+import orjson
+import random
 import redis
 import time
-import json
-from datetime import datetime
-from base_limiter import BaseLimiter
 
-
-class LeakyBucketLimiter(BaseLimiter):
+from redis_pool import format_time, get_pool, run_script
+
+
+# Leak + capacity checks + state write + history append for a batch of
+# requests, executed atomically in one round-trip. The leak is applied once,
+# then each (client_id, cost) pair is checked in order against the bucket.
+# Bucket state is one hash of integers: qm = queue size in milli-requests,
+# tm = last leak time in ms. Rates, costs and capacity are passed in the same units.
+# KEYS: [state_key, history_key]
+# ARGV: [now_ms, leak_rate_milli, capacity_milli, time_str, client_id_1, cost_milli_1, ...]
+# Returns: [allowed_1, queue_milli_1, allowed_2, queue_milli_2, ...]
+_LEAK_LUA = """
+local now = tonumber(ARGV[1])
+local state = redis.call('HMGET', KEYS[1], 'qm', 'tm')
+local stored_queue = tonumber(state[1] or '0')
+local stored_leak = tonumber(state[2] or ARGV[1])
+local queue = stored_queue
+local last_leak = stored_leak
+-- A wall-clock step backwards must not refill the bucket
+local elapsed = math.max(0, now - last_leak)
+local rate = tonumber(ARGV[2])
+local leaked = math.floor(elapsed * rate / 1000)
+if leaked >= queue or rate <= 0 then
+    queue = math.max(0, queue - leaked)
+    last_leak = now
+else
+    queue = queue - leaked
+    -- Carry the time not yet turned into a whole milli-request forward,
+    -- so frequent calls do not round the leak away
+    last_leak = now - math.floor((elapsed * rate - leaked * 1000) / rate)
+end
+local capacity = tonumber(ARGV[3])
+local results = {}
+for i = 5, #ARGV, 2 do
+    local cost = tonumber(ARGV[i + 1])
+    local allowed = 0
+    if queue + cost <= capacity then
+        queue = queue + cost
+        allowed = 1
+    end
+    redis.call('LPUSH', KEYS[2], cjson.encode({
+        time = ARGV[4],
+        user = ARGV[i],
+        status = allowed == 1 and '成功' or '拒絕',
+        count_after = math.floor(queue / 10 + 0.5) / 100,
+        cost = cost / 1000,
+        timestamp = now / 1000,
+        algorithm = 'leaky_bucket'
+    }))
+    results[#results + 1] = allowed
+    results[#results + 1] = queue
+end
+-- Nothing leaked or queued (e.g. rejects at a full bucket): skip the write
+if queue ~= stored_queue or last_leak ~= stored_leak then
+    redis.call('HSET', KEYS[1], 'qm', queue, 'tm', last_leak)
+end
+redis.call('LTRIM', KEYS[2], 0, 49)
+return results
+"""
+
+# EVALSHA digest of the script, shared by all instances; loaded on first NOSCRIPT
+_LEAK_SHA = hashlib.sha1(_LEAK_LUA.encode()).hexdigest()
+
+
+class LeakyBucketLimiter:
     """
     Leaky Bucket Rate Limiter implementation using Redis.
 
@@ -21,6 +84,12 @@ class LeakyBucketLimiter(BaseLimiter):
     - Output rate is always smooth and predictable
     """
 
+    # Bucket visuals for 0-10 filled blocks, built once
+    _BUCKET_STRINGS = tuple("🟦" * i + "⬜" * (10 - i) for i in range(11))
+
+    # Seconds the bucket state read by status calls is reused before reading Redis again
+    STATUS_CACHE_TTL = 0.3
+
     def __init__(self, capacity, leak_rate, redis_client=None):
         """
         Initialize the leaky bucket rate limiter.
@@ -30,62 +99,99 @@ class LeakyBucketLimiter(BaseLimiter):
         """
         self.capacity = capacity
         self.leak_rate = leak_rate
-        self.redis_client = redis_client or redis.Redis(
-            host='redis',
-            port=6379,
-            db=0,
-            decode_responses=True
-        )
-
-        self.queue_size_key = "leaky_bucket_queue_size"
-        self.last_leak_key = "leaky_bucket_last_leak"
+        self.redis_client = redis_client or redis.Redis(connection_pool=get_pool())
+
+        self.state_key = "leaky_bucket:state"
         self.history_key = "leaky_bucket_history"
 
-        self._initialize_bucket()
+        # (fetched_at, queue_size, last_leak) of the last bucket state seen by this instance
+        self._state_cache = (None, 0.0, 0.0)
 
-    def _initialize_bucket(self):
+    @property
+    def capacity(self):
         """
-        Initialize Leaky Bucket state in Redis.
-        Sets bucket to empty state if no previous state exists.
+        Maximum capacity of the bucket (queue size).
         """
-        if not self.redis_client.exists(self.queue_size_key):
-            self.redis_client.set(self.queue_size_key, 0.0)
-            self.redis_client.set(self.last_leak_key, time.time())
+        return self._capacity
 
-    def _leak_requests(self):
+    @capacity.setter
+    def capacity(self, capacity):
+        """
+        Set the capacity and cache it in milli-requests for the script.
+        :param capacity: Maximum capacity of the bucket (queue size).
+        """
+        self._capacity = capacity
+        self._capacity_milli = round(capacity * 1000)
+
+    @property
+    def leak_rate(self):
+        """
+        Number of requests that leak out per second.
+        """
+        return self._leak_rate
+
+    @leak_rate.setter
+    def leak_rate(self, leak_rate):
+        """
+        Set the leak rate and cache it in milli-requests per second for the script.
+        :param leak_rate: Number of requests that leak out per second.
         """
-        Leak requests from bucket based on elapsed time.
+        self._leak_rate = leak_rate
+        self._leak_rate_milli = round(leak_rate * 1000)
 
-        Algorithm:
-        1. Calculate time passed since last leak
+    def _compute_current_queue(self, now=None):
+        """
+        Compute the current queue size without writing to Redis.
+
+        Applies the leak since the last stored update locally, so status
+        reads cost at most one HMGET and leave the stored state untouched.
+        The stored state is reused for STATUS_CACHE_TTL seconds, so repeated
+        dashboard reruns do not read Redis each time; the leak is still
+        applied up to now, so only writes by other clients can be missed:
+        1. Calculate time passed since last leak (never negative)
         2. Calculate requests to leak (time_passed * leak_rate)
         3. Reduce queue size by leaked requests (minimum 0)
-        4. Update Redis with new state
-
-        This simulates the constant "dripping" of the leaky bucket.
 
+        :param now: Timestamp to compute at; read from the clock if omitted.
         :return: Current queue size after leaking.
         """
-        current_time = time.time()
+        if now is None:
+            now = time.time()
 
-        current_queue_size = float(self.redis_client.get(self.queue_size_key) or 0)
-        last_leak_time = float(self.redis_client.get(self.last_leak_key) or current_time)
+        fetched_at = self._state_cache[0]
+        if fetched_at is None or not 0 <= now - fetched_at < self.STATUS_CACHE_TTL:
+            self._store_state(now, *self.redis_client.hmget(self.state_key, 'qm', 'tm'))
 
-        time_passed = current_time - last_leak_time
-        requests_to_leak = time_passed * self.leak_rate
+        return self._queue_at(now)
 
-        new_queue_size = max(0, current_queue_size - requests_to_leak)
+    def _store_state(self, now, queue_milli, last_leak_ms):
+        """
+        Cache a bucket state read from Redis.
+        :param now: Time the state was read.
+        :param queue_milli: Stored qm field, or None if the bucket has no state.
+        :param last_leak_ms: Stored tm field, or None if the bucket has no state.
+        """
+        queue_size = int(queue_milli or 0) / 1000
+        last_leak = int(last_leak_ms) / 1000 if last_leak_ms else now
+        self._state_cache = (now, queue_size, last_leak)
 
-        self.redis_client.set(self.queue_size_key, new_queue_size)
-        self.redis_client.set(self.last_leak_key, current_time)
+    def _queue_at(self, now):
+        """
+        Apply the leak to the cached bucket state.
+        :param now: Timestamp to compute at.
+        :return: Queue size at now.
+        """
+        _, queue_size, last_leak = self._state_cache
 
-        return new_queue_size
+        # A wall-clock step backwards must not refill the bucket
+        time_passed = max(0.0, now - last_leak)
+        return max(0.0, queue_size - time_passed * self.leak_rate)
 
     def is_allowed(self, client_id, cost=1):
         """
         Check if a request is allowed to enter the leaky bucket.
 
-        Algorithm:
+        Algorithm (run atomically in one Lua script):
         1. Leak requests based on elapsed time
         2. Check if bucket has space for new request
         3. If yes, add request to queue (increase queue size)
@@ -96,76 +202,98 @@ class LeakyBucketLimiter(BaseLimiter):
         :param cost: Queue space required for this request.
         :return: Tuple (allowed: bool, info: dict with queue info).
         """
-        current_time = time.time()
-        current_queue_size = self._leak_requests()
+        return self.is_allowed_batch([(client_id, cost)])[0]
 
-        if current_queue_size + cost <= self.capacity:
-            new_queue_size = current_queue_size + cost
-            self.redis_client.set(self.queue_size_key, new_queue_size)
-            allowed = True
-            final_queue_size = new_queue_size
-        else:
-            allowed = False
-            final_queue_size = current_queue_size
+    def is_allowed_batch(self, requests):
+        """
+        Check several requests in one script call.
 
-        self._add_history_to_redis(client_id, allowed, final_queue_size, cost, current_time)
+        The bucket is leaked once, then the requests are checked in order
+        against it; the whole batch is atomic against other clients.
+
+        :param requests: Iterable of (client_id, cost) tuples.
+        :return: List of (allowed: bool, info: dict with queue info) tuples, like is_allowed().
+        """
+        now_ms = time.time_ns() // 1_000_000
+        current_time = now_ms / 1000
+        args = [now_ms, self._leak_rate_milli, self._capacity_milli, format_time(current_time, millis=True)]
+        for client_id, cost in requests:
+            args.extend((client_id, round(cost * 1000)))
+        if len(args) == 4:
+            return []
+
+        results = run_script(self.redis_client, _LEAK_SHA, _LEAK_LUA, (self.state_key, self.history_key), args)
+        parsed = [self._parse_result(results[i], results[i + 1]) for i in range(0, len(results), 2)]
+        self._state_cache = (current_time, parsed[-1][1]['queue_size'], current_time)
+
+        return parsed
+
+    @staticmethod
+    def _parse_result(allowed, queue_milli):
+        """
+        Convert one script result pair into the is_allowed() return value.
+        :param allowed: 1 if the request was queued, else 0.
+        :param queue_milli: Queue size after the request, in milli-requests.
+        :return: Tuple (allowed: bool, info: dict with queue info).
+        """
+        allowed = bool(allowed)
+        final_queue_size = queue_milli / 1000
 
         return allowed, {
             'queue_position': final_queue_size if allowed else None,
             'queue_size': final_queue_size
         }
 
-    def _add_history_to_redis(self, client_id, allowed, queue_size_after, cost, request_time):
-        """
-        Add request history to shared Redis storage.
-        :param client_id: Client identifier.
-        :param allowed: Whether request was allowed.
-        :param queue_size_after: Queue size after processing request.
-        :param cost: Queue space requested.
-        :param request_time: Timestamp of the request.
-        """
-        history_record = {
-            'time': datetime.fromtimestamp(request_time).strftime('%H:%M:%S.%f')[:-3],
-            'user': client_id,
-            'status': '成功' if allowed else '拒絕',
-            'count_after': round(queue_size_after, 2),
-            'cost': cost,
-            'timestamp': request_time,
-            'algorithm': 'leaky_bucket'
-        }
-
-        # Add to Redis list (newest first)
-        self.redis_client.lpush(self.history_key, json.dumps(history_record))
-
-        self.redis_client.ltrim(self.history_key, 0, 49)
-
     @property
     def request_history(self):
         """
         Get shared request history from Redis.
-        :return: List of recent request records.
+        :return: List of the 20 most recent request records.
+        """
+        return self.get_history()
+
+    def get_history(self, limit=20):
+        """
+        Get the most recent request records from Redis.
+        :param limit: Maximum number of records to fetch.
+        :return: List of recent request records, newest first.
+        """
+        return self._parse_history(self.redis_client.lrange(self.history_key, 0, limit - 1))
+
+    @staticmethod
+    def _parse_history(history_data):
+        """
+        Decode history records, skipping malformed entries.
+        :param history_data: LRANGE result of JSON records.
+        :return: List of request records.
         """
-        history_data = self.redis_client.lrange(self.history_key, 0, 19)  # Recent 20 records
         history_list = []
 
         for record_json in history_data:
             try:
-                record = json.loads(record_json)
-                history_list.append(record)
-            except json.JSONDecodeError:
+                history_list.append(orjson.loads(record_json))
+            except orjson.JSONDecodeError:
                 continue
 
         return history_list
 
-    def get_status(self):
+    def get_status(self, now=None):
         """
         Get current leaky bucket status.
 
         Automatically leaks requests and returns current state.
 
+        :param now: Timestamp to report at; read from the clock if omitted.
+        :return: Dictionary containing current status information.
+        """
+        return self._build_status(self._compute_current_queue(now))
+
+    def _build_status(self, current_queue_size):
+        """
+        Build a status dictionary from a queue size.
+        :param current_queue_size: Queue size after leaking.
         :return: Dictionary containing current status information.
         """
-        current_queue_size = self._leak_requests()
         time_to_empty = current_queue_size / self.leak_rate if self.leak_rate > 0 else 0
 
         return {
@@ -180,35 +308,89 @@ class LeakyBucketLimiter(BaseLimiter):
             'time_to_empty': round(time_to_empty, 2)
         }
 
+    def get_dashboard(self, limit=20):
+        """
+        Get status and recent history together in one pipelined round-trip.
+        The bucket state read is also stored in the status cache.
+        :param limit: Maximum number of history records to fetch.
+        :return: Tuple (status: dict like get_status(), history: list like get_history()).
+        """
+        now = time.time()
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hmget(self.state_key, 'qm', 'tm')
+        pipe.lrange(self.history_key, 0, limit - 1)
+        state, history_data = pipe.execute()
+
+        self._store_state(now, *state)
+        return self._build_status(self._queue_at(now)), self._parse_history(history_data)
+
+    def invalidate_status(self):
+        """
+        Drop the cached bucket state so the next status call reads from Redis.
+        """
+        self._state_cache = (None, 0.0, 0.0)
+
     def reset(self):
         """
         Reset leaky bucket state to empty.
-        Clears queue and resets leak timing.
+        Removes the bucket state and history records; a missing state is
+        read as an empty bucket, so nothing needs to be written back.
+        """
+        self.redis_client.unlink(self.state_key, self.history_key)
+        self.invalidate_status()
+
+    def simulate(self, n_requests, arrival_rate, cost=1):
+        """
+        Simulate a burst offline, without touching Redis or history.
+
+        Requests arrive as a Poisson process into an initially empty bucket
+        with this limiter's capacity and leak rate; the leak is applied
+        between arrivals exactly as in is_allowed.
+
+        :param n_requests: Number of simulated requests.
+        :param arrival_rate: Mean number of arrivals per second.
+        :param cost: Queue space required by each request.
+        :return: Dictionary with allowed/rejected counts, simulated duration and final queue size.
+        :raises ValueError: If arrival_rate is not positive.
         """
-        # Reset queue size to empty
-        self.redis_client.set(self.queue_size_key, 0.0)
-        self.redis_client.set(self.last_leak_key, time.time())
+        if arrival_rate <= 0:
+            raise ValueError("arrival_rate must be positive")
 
-        # Clear history records
-        self.redis_client.delete(self.history_key)
+        queue_size = 0.0
+        now = 0.0
+        allowed = 0
 
-    def get_bucket_visualization(self):
+        for _ in range(n_requests):
+            elapsed = random.expovariate(arrival_rate)
+            now += elapsed
+            queue_size = max(0.0, queue_size - elapsed * self.leak_rate)
+            if queue_size + cost <= self.capacity:
+                queue_size += cost
+                allowed += 1
+
+        return {
+            'allowed': allowed,
+            'rejected': n_requests - allowed,
+            'duration': round(now, 2),
+            'queue_size': round(queue_size, 2)
+        }
+
+    def get_bucket_visualization(self, now=None):
         """
         Get visual representation of current bucket state.
+        :param now: Timestamp to report at; read from the clock if omitted.
         :return: Dictionary with visualization data.
         """
-        current_queue_size = self._leak_requests()
-        fill_percentage = (current_queue_size / self.capacity) * 100
-
-        # Create simple text visualization
-        filled_blocks = int((current_queue_size / self.capacity) * 10)
-        empty_blocks = 10 - filled_blocks
+        current_queue_size = self._compute_current_queue(now)
+        fill_ratio = current_queue_size / self.capacity
 
-        visual = "🟦" * filled_blocks + "⬜" * empty_blocks
+        # Simple text visualization, one block per 10% of capacity
+        visual = self._BUCKET_STRINGS[max(0, min(10, int(fill_ratio * 10)))]
 
         return {
             'visual': visual,
-            'percentage': round(fill_percentage, 1),
+            'percentage': round(fill_ratio * 100, 1),
             'queue_size': round(current_queue_size, 2),
             'capacity': self.capacity
         }
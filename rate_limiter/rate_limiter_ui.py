@@ -1,32 +1,60 @@
 from datetime import datetime
+import pandas as pd
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
+
+from base_limiter import BaseLimiter
+
+
+# 歷史記錄狀態 -> 顯示文字
+_STATUS_LABELS = {'成功': "✅ 成功", '拒絕': "❌ 拒絕"}
+
+# window_reset 欄位 -> 備註文字（沒有此欄位的演算法為空白）
+_RESET_NOTES = {True: " (窗口重置)", False: ""}
+
+
+@st.cache_data(ttl=0.5, show_spinner=False)
+def _cached_dashboard(_limiter: BaseLimiter, algorithm_name, limiter_id):
+    """取得狀態與最近 10 筆歷史記錄，同一時段內的重新執行共用一次讀取"""
+    if hasattr(_limiter, 'get_dashboard'):
+        return _limiter.get_dashboard(limit=10)
+    return _limiter.get_status(), _limiter.get_history(limit=10)
 
 
 class RateLimiterUI:
     """可重用的 Rate Limiter UI 組件"""
 
     @staticmethod
-    def render_status(limiter):
+    def rerun():
+        """清除狀態快取並重新執行；在 fragment 重新執行中只重跑該區塊"""
+        _cached_dashboard.clear()
+        try:
+            st.rerun(scope="fragment")
+        except StreamlitAPIException:
+            # 完整頁面執行中不能只重跑 fragment
+            st.rerun()
+
+    @staticmethod
+    def render_status(limiter: BaseLimiter, status=None):
         """渲染狀態顯示區域（通用版本）"""
-        status = limiter.get_status()
+        if status is None:
+            status = limiter.get_status()
+        time_remaining = status['time_remaining']
 
         st.subheader(f"📊 {status['algorithm']} 狀態")
-        col1, col2, col3, col4 = st.columns(4)
 
-        with col1:
-            st.metric("已使用", status['current_count'])
-        with col2:
-            st.metric("總配額", status['max_requests'])
-        with col3:
-            st.metric("剩餘", status['remaining'])
-        with col4:
-            if 'time_remaining' in status and status['time_remaining'] > 0:
-                time_remaining = status['time_remaining']
-                if time_remaining > 60:
-                    time_display = f"{time_remaining/60:.1f}分"
-                else:
-                    time_display = f"{time_remaining:.0f}秒"
-                st.metric("窗口重置", time_display)
+        # 所有指標合成一列表格，一次送出
+        metrics = {
+            "已使用": status['current_count'],
+            "總配額": status['max_requests'],
+            "剩餘": status['remaining'],
+        }
+        if time_remaining > 0:
+            if time_remaining > 60:
+                metrics["窗口重置"] = f"{time_remaining/60:.1f}分"
+            else:
+                metrics["窗口重置"] = f"{time_remaining:.0f}秒"
+        st.dataframe(pd.DataFrame([metrics]), hide_index=True)
 
         # 使用率計算和進度條
         usage_rate = status['current_count'] / status['max_requests']
@@ -45,48 +73,46 @@ class RateLimiterUI:
             st.warning("⚠️ 接近限制")
 
         # 倒數計時視覺化（靜態顯示）
-        if 'time_remaining' in status and status['time_remaining'] > 0:
+        if time_remaining > 0:
             st.write("⏰ **窗口重置倒數:**")
 
             # 計算倒數進度
-            window_size = getattr(limiter, 'window_size', 60)
-            countdown_progress = 1 - (status['time_remaining'] / window_size)
+            countdown_progress = 1 - (time_remaining / status['window_size'])
             countdown_progress = max(0.0, min(1.0, countdown_progress))
 
             st.progress(countdown_progress)
 
             # 倒數數字顯示
-            if status['time_remaining'] > 60:
-                time_text = f"還有 {status['time_remaining']/60:.1f} 分鐘後重置"
-            elif status['time_remaining'] > 10:
-                time_text = f"還有 {status['time_remaining']:.0f} 秒後重置"
+            if time_remaining > 60:
+                time_text = f"還有 {time_remaining/60:.1f} 分鐘後重置"
+            elif time_remaining > 10:
+                time_text = f"還有 {time_remaining:.0f} 秒後重置"
             else:
-                time_text = f"還有 {status['time_remaining']:.1f} 秒後重置"
+                time_text = f"還有 {time_remaining:.1f} 秒後重置"
 
             st.caption(time_text)
 
             # 提示用戶手動刷新
-            if status['time_remaining'] < 10:
+            if time_remaining < 10:
                 st.info("🔄 接近重置時間，點擊手動刷新查看最新狀態")
 
         return status
 
     @staticmethod
-    def render_token_bucket_status(limiter):
+    def render_token_bucket_status(limiter: BaseLimiter, status=None):
         """渲染 Token Bucket 狀態顯示"""
-        status = limiter.get_status()
+        if status is None:
+            status = limiter.get_status()
 
         st.subheader(f"🪣 {status['algorithm']} 狀態")
-        col1, col2, col3, col4 = st.columns(4)
 
-        with col1:
-            st.metric("當前 Tokens", f"{status['current_tokens']:.1f}")
-        with col2:
-            st.metric("桶子容量", status['capacity'])
-        with col3:
-            st.metric("補充速率", f"{status['refill_rate']}/秒")
-        with col4:
-            st.metric("填滿時間", f"{status['time_to_fill']:.1f}秒")
+        # 所有指標合成一列表格，一次送出
+        st.dataframe(pd.DataFrame([{
+            "當前 Tokens": f"{status['current_tokens']:.1f}",
+            "桶子容量": status['capacity'],
+            "補充速率": f"{status['refill_rate']}/秒",
+            "填滿時間": f"{status['time_to_fill']:.1f}秒",
+        }]), hide_index=True)
 
         # Token 使用率計算
         usage_rate = status['current_tokens'] / status['capacity']
@@ -118,7 +144,7 @@ class RateLimiterUI:
         return status
 
     @staticmethod
-    def render_token_bucket_user_testing(limiter, algorithm_name):
+    def render_token_bucket_user_testing(limiter: BaseLimiter, algorithm_name):
         """渲染 Token Bucket 用戶測試區域"""
         col1, col2 = st.columns([2, 1])
 
@@ -144,7 +170,7 @@ class RateLimiterUI:
                     else:
                         st.error(f"❌ {selected_user} 請求被拒絕！Tokens 不足")
 
-                    st.rerun()
+                    RateLimiterUI.rerun()
 
             # 快速測試按鈕
             st.subheader("⚡ 快速測試")
@@ -153,27 +179,26 @@ class RateLimiterUI:
             with test_col1:
                 if st.button("突發測試 (5x1)", key=f"{algorithm_name}_burst1"):
                     results = []
-                    for i in range(5):
-                        allowed, _ = limiter.is_allowed(selected_user, 1)
+                    for allowed, _ in limiter.is_allowed_batch([(selected_user, 1)] * 5):
                         results.append("✅" if allowed else "❌")
                     st.write(f"5次1token: {' '.join(results)}")
-                    st.rerun()
+                    RateLimiterUI.rerun()
 
             with test_col2:
                 if st.button("大量測試 (1x5)", key=f"{algorithm_name}_burst2"):
                     allowed, _ = limiter.is_allowed(selected_user, 5)
                     st.write(f"1次5tokens: {'✅' if allowed else '❌'}")
-                    st.rerun()
+                    RateLimiterUI.rerun()
 
             with test_col3:
                 if st.button("多用戶測試", key=f"{algorithm_name}_multi"):
                     results = []
-                    for user in users:
-                        allowed, _ = limiter.is_allowed(user, 1)
+                    batch = limiter.is_allowed_batch([(user, 1) for user in users])
+                    for user, (allowed, _) in zip(users, batch):
                         results.append(f"{user}: {'✅' if allowed else '❌'}")
                     for result in results:
                         st.write(result)
-                    st.rerun()
+                    RateLimiterUI.rerun()
 
         with col2:
             # 控制區域
@@ -182,7 +207,7 @@ class RateLimiterUI:
             if st.button("🗑️ 重置系統", type="secondary", key=f"{algorithm_name}_reset"):
                 limiter.reset()
                 st.success("系統已重置！")
-                st.rerun()
+                RateLimiterUI.rerun()
 
             # Token 桶視覺化控制台
             st.subheader("🪣 Token 桶狀態")
@@ -196,21 +221,20 @@ class RateLimiterUI:
                 st.write("❌ 無法顯示桶狀態")
 
     @staticmethod
-    def render_leaky_bucket_status(limiter):
+    def render_leaky_bucket_status(limiter: BaseLimiter, status=None):
         """渲染 Leaky Bucket 狀態顯示"""
-        status = limiter.get_status()
+        if status is None:
+            status = limiter.get_status()
 
         st.subheader(f"🕳️ {status['algorithm']} 狀態")
-        col1, col2, col3, col4 = st.columns(4)
 
-        with col1:
-            st.metric("排隊數量", f"{status['queue_size']:.1f}")
-        with col2:
-            st.metric("桶子容量", status['capacity'])
-        with col3:
-            st.metric("漏出速率", f"{status['leak_rate']}/秒")
-        with col4:
-            st.metric("清空時間", f"{status['time_to_empty']:.1f}秒")
+        # 所有指標合成一列表格，一次送出
+        st.dataframe(pd.DataFrame([{
+            "排隊數量": f"{status['queue_size']:.1f}",
+            "桶子容量": status['capacity'],
+            "漏出速率": f"{status['leak_rate']}/秒",
+            "清空時間": f"{status['time_to_empty']:.1f}秒",
+        }]), hide_index=True)
 
         # 桶子使用率計算
         usage_rate = status['queue_size'] / status['capacity']
@@ -256,7 +280,7 @@ class RateLimiterUI:
         return status
 
     @staticmethod
-    def render_leaky_bucket_user_testing(limiter, algorithm_name):
+    def render_leaky_bucket_user_testing(limiter: BaseLimiter, algorithm_name):
         """渲染 Leaky Bucket 用戶測試區域"""
         col1, col2 = st.columns([2, 1])
 
@@ -273,16 +297,20 @@ class RateLimiterUI:
             with user_col2:
                 queue_cost = st.number_input("排隊數量", 1, 10, 1, key=f"{algorithm_name}_cost")
 
+            # 上一次操作的結果保存在 session_state，重新執行後顯示一次
+            results_key = f"{algorithm_name}_last_results"
+
             with user_col3:
                 if st.button(f"🚰 排隊 {queue_cost} 個", type="primary", key=f"{algorithm_name}_send"):
                     allowed, extra_info = limiter.is_allowed(selected_user, queue_cost)
 
                     if allowed:
-                        st.success(f"✅ {selected_user} 成功排隊 {queue_cost} 個請求！")
+                        message = ("success", f"✅ {selected_user} 成功排隊 {queue_cost} 個請求！")
                     else:
-                        st.error(f"❌ {selected_user} 排隊失敗！桶子已滿")
+                        message = ("error", f"❌ {selected_user} 排隊失敗！桶子已滿")
+                    st.session_state[results_key] = [message]
 
-                    st.rerun()
+                    RateLimiterUI.rerun()
 
             # 快速測試按鈕
             st.subheader("⚡ 快速測試")
@@ -291,27 +319,34 @@ class RateLimiterUI:
             with test_col1:
                 if st.button("連續排隊測試", key=f"{algorithm_name}_queue1"):
                     results = []
-                    for i in range(5):
-                        allowed, _ = limiter.is_allowed(selected_user, 1)
+                    for allowed, _ in limiter.is_allowed_batch([(selected_user, 1)] * 5):
                         results.append("✅" if allowed else "❌")
-                    st.write(f"5次排隊: {' '.join(results)}")
-                    st.rerun()
+                    st.session_state[results_key] = [("write", f"5次排隊: {' '.join(results)}")]
+                    RateLimiterUI.rerun()
 
             with test_col2:
                 if st.button("大量排隊測試", key=f"{algorithm_name}_queue2"):
                     allowed, _ = limiter.is_allowed(selected_user, 5)
-                    st.write(f"一次排隊5個: {'✅' if allowed else '❌'}")
-                    st.rerun()
+                    st.session_state[results_key] = [("write", f"一次排隊5個: {'✅' if allowed else '❌'}")]
+                    RateLimiterUI.rerun()
 
             with test_col3:
                 if st.button("多用戶排隊", key=f"{algorithm_name}_multi"):
                     results = []
-                    for user in users:
-                        allowed, _ = limiter.is_allowed(user, 1)
-                        results.append(f"{user}: {'✅' if allowed else '❌'}")
-                    for result in results:
-                        st.write(result)
-                    st.rerun()
+                    batch = limiter.is_allowed_batch([(user, 1) for user in users])
+                    for user, (allowed, _) in zip(users, batch):
+                        results.append(("write", f"{user}: {'✅' if allowed else '❌'}"))
+                    st.session_state[results_key] = results
+                    RateLimiterUI.rerun()
+
+            for kind, message in st.session_state.pop(results_key, []):
+                getattr(st, kind)(message)
+
+            # 離線模擬，不寫入 Redis
+            if st.button("大量模擬 (1000次)", key=f"{algorithm_name}_simulate"):
+                sim = limiter.simulate(1000, limiter.leak_rate * 2)
+                st.write(f"到達速率為漏出速率 2 倍，模擬 {sim['duration']} 秒: "
+                         f"✅ {sim['allowed']} 次 / ❌ {sim['rejected']} 次")
 
         with col2:
             # 控制區域
@@ -320,25 +355,19 @@ class RateLimiterUI:
             if st.button("🗑️ 重置系統", type="secondary", key=f"{algorithm_name}_reset"):
                 limiter.reset()
                 st.success("系統已重置！")
-                st.rerun()
+                RateLimiterUI.rerun()
 
             # 桶子狀態可視化
             st.subheader("🪣 桶子狀態")
-            status = limiter.get_status()
-
             # 簡單的文字可視化
-            if status['capacity'] > 0:
-                filled_slots = int((status['queue_size'] / status['capacity']) * 10)
-                filled_slots = max(0, min(10, filled_slots))
-                empty_slots = 10 - filled_slots
-
-                bucket_visual = "🟦" * filled_slots + "⬜" * empty_slots
+            if limiter.capacity > 0:
+                bucket_viz = limiter.get_bucket_visualization()
                 st.write("桶子狀態:")
-                st.write(bucket_visual)
-                st.caption(f"排隊: {status['queue_size']:.1f}/{status['capacity']}")
+                st.write(bucket_viz['visual'])
+                st.caption(f"排隊: {bucket_viz['queue_size']:.1f}/{bucket_viz['capacity']}")
 
     @staticmethod
-    def render_user_testing(limiter, algorithm_name):
+    def render_user_testing(limiter: BaseLimiter, algorithm_name):
         """渲染用戶測試區域（通用版本）"""
         col1, col2 = st.columns([2, 1])
 
@@ -364,7 +393,7 @@ class RateLimiterUI:
                     else:
                         st.error(f"❌ {selected_user} 請求被拒絕！")
 
-                    st.rerun()
+                    RateLimiterUI.rerun()
 
             # 快速測試按鈕
             st.subheader("⚡ 快速測試")
@@ -373,33 +402,28 @@ class RateLimiterUI:
             with test_col1:
                 if st.button("單用戶連發5次", key=f"{algorithm_name}_test1"):
                     results = []
-                    for i in range(5):
-                        allowed, _ = limiter.is_allowed(selected_user)
+                    for allowed, _ in limiter.is_allowed_batch([(selected_user, 1)] * 5):
                         results.append("✅" if allowed else "❌")
                     st.write(f"結果: {' '.join(results)}")
-                    st.rerun()
+                    RateLimiterUI.rerun()
 
             with test_col2:
                 if st.button("多用戶各發1次", key=f"{algorithm_name}_test2"):
                     results = []
-                    for user in users:
-                        allowed, _ = limiter.is_allowed(user)
+                    batch = limiter.is_allowed_batch([(user, 1) for user in users])
+                    for user, (allowed, _) in zip(users, batch):
                         results.append(f"{user}: {'✅' if allowed else '❌'}")
                     for result in results:
                         st.write(result)
-                    st.rerun()
+                    RateLimiterUI.rerun()
 
             with test_col3:
                 if st.button("壓力測試 (10次)", key=f"{algorithm_name}_test3"):
                     import random
-                    success_count = 0
-                    for i in range(10):
-                        user = random.choice(users)
-                        allowed, _ = limiter.is_allowed(user)
-                        if allowed:
-                            success_count += 1
+                    results = limiter.is_allowed_batch([(user, 1) for user in random.choices(users, k=10)])
+                    success_count = sum(1 for allowed, _ in results if allowed)
                     st.write(f"成功: {success_count}/10")
-                    st.rerun()
+                    RateLimiterUI.rerun()
 
         with col2:
             # 控制區域
@@ -408,50 +432,52 @@ class RateLimiterUI:
             if st.button("🗑️ 重置系統", type="secondary", key=f"{algorithm_name}_reset"):
                 limiter.reset()
                 st.success("系統已重置！")
-                st.rerun()
+                RateLimiterUI.rerun()
 
     @staticmethod
-    def render_history(limiter):
+    def render_history(limiter: BaseLimiter, history=None):
         """渲染歷史記錄區域"""
-        if limiter.request_history:
+        if history is None:
+            history = limiter.get_history(limit=10)  # 最近10筆，最新在前
+        if history:
             st.subheader("📜 請求歷史記錄")
 
-            # 以表格形式顯示
-            history_data = []
-            for record in limiter.request_history[:10]:  # 最近10筆，最新在前
-                status_icon = "✅" if record['status'] == '成功' else "❌"
-                reset_info = " (窗口重置)" if record.get('window_reset') else ""
-                history_data.append({
-                    '時間': record['time'],
-                    '用戶': record['user'],
-                    '狀態': f"{status_icon} {record['status']}",
-                    '系統計數': record['count_after'],
-                    '備註': reset_info
-                })
-
-            if history_data:
-                st.table(history_data)
+            # 以表格形式顯示，整欄轉換而非逐筆建立
+            df = pd.DataFrame(history, columns=['time', 'user', 'status', 'count_after', 'window_reset'])
+            st.table(pd.DataFrame({
+                '時間': df['time'],
+                '用戶': df['user'],
+                '狀態': df['status'].map(_STATUS_LABELS),
+                '系統計數': df['count_after'],
+                '備註': df['window_reset'].map(_RESET_NOTES).fillna("")
+            }))
         else:
             st.info("📝 尚無請求記錄")
 
     # 方便的調用方法
     @staticmethod
-    def render_algorithm_ui(limiter, algorithm_name):
+    def render_algorithm_ui(limiter: BaseLimiter, algorithm_name):
         """根據算法類型自動選擇合適的UI渲染方法"""
         algorithm_type = limiter.__class__.__name__.lower()
 
+        # 狀態與歷史記錄快取 0.5 秒，送出請求或重置時清除
+        status, history = _cached_dashboard(limiter, algorithm_name, id(limiter))
+
         if 'tokenbucket' in algorithm_type:
             # Token Bucket 算法
-            RateLimiterUI.render_token_bucket_status(limiter)
+            RateLimiterUI.render_token_bucket_status(limiter, status)
+            st.markdown("---")
             RateLimiterUI.render_token_bucket_user_testing(limiter, algorithm_name)
         elif 'leakybucket' in algorithm_type:
             # Leaky Bucket 算法
-            RateLimiterUI.render_leaky_bucket_status(limiter)
+            RateLimiterUI.render_leaky_bucket_status(limiter, status)
+            st.markdown("---")
             RateLimiterUI.render_leaky_bucket_user_testing(limiter, algorithm_name)
         else:
             # 其他算法（Fixed Window, Sliding Window等）
-            RateLimiterUI.render_status(limiter)
+            RateLimiterUI.render_status(limiter, status)
+            st.markdown("---")
             RateLimiterUI.render_user_testing(limiter, algorithm_name)
 
         # 所有算法都顯示歷史記錄
-        RateLimiterUI.render_history(limiter)
+        RateLimiterUI.render_history(limiter, history)
@@ -0,0 +1,85 @@
+import os
+import socket
+import time
+
+
+# Connection pool shared by all limiters in this process
+_POOL = None
+
+# [second, "HH:MM:SS"] of the last formatted history time
+_TIME_CACHE = [None, ""]
+
+
+def get_pool():
+    """
+    Get the process-wide Redis connection pool, creating it on first use.
+    The server is taken from the REDIS_URL environment variable
+    (use a rediss:// URL for TLS); defaults to the docker-compose service.
+    Idle connections are kept alive with TCP probes and health-checked before
+    reuse, so polling after a quiet period does not pay for a reconnect.
+    When all connections are busy, callers wait for one instead of opening more.
+    redis-py already sets TCP_NODELAY on its sockets, so small pipelined
+    writes are flushed immediately.
+    :return: redis.BlockingConnectionPool instance.
+    """
+    global _POOL
+    if _POOL is None:
+        import redis
+
+        # Probe options are Linux names; other platforms use the OS defaults
+        keepalive_options = {}
+        for name, value in (('TCP_KEEPIDLE', 30), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3)):
+            if hasattr(socket, name):
+                keepalive_options[getattr(socket, name)] = value
+
+        _POOL = redis.BlockingConnectionPool.from_url(
+            os.getenv('REDIS_URL', 'redis://redis:6379/0'),
+            max_connections=32,
+            socket_keepalive=True,
+            socket_keepalive_options=keepalive_options,
+            health_check_interval=30,
+            retry_on_timeout=True,
+            decode_responses=True
+        )
+    return _POOL
+
+
+def run_script(client, sha, lua, keys, args):
+    """
+    Execute a Lua script via EVALSHA.
+    If the server does not have the script yet (first use, restart or
+    SCRIPT FLUSH), it is loaded once and the call retried.
+    :param client: Redis client to run the script on.
+    :param sha: SHA1 digest of the script.
+    :param lua: Script source, loaded on NOSCRIPT.
+    :param keys: Sequence of Redis keys passed as KEYS.
+    :param args: Sequence of script arguments passed as ARGV.
+    :return: Script result.
+    """
+    try:
+        return client.evalsha(sha, len(keys), *keys, *args)
+    except Exception as exc:
+        # redis is imported lazily, so resolve the exception type only on failure
+        from redis.exceptions import NoScriptError
+
+        if not isinstance(exc, NoScriptError):
+            raise
+    client.script_load(lua)
+    return client.evalsha(sha, len(keys), *keys, *args)
+
+
+def format_time(request_time, millis=False):
+    """
+    Format a timestamp for the history table.
+    The HH:MM:SS part is reused while requests fall in the same second.
+    :param request_time: Unix timestamp in seconds.
+    :param millis: Whether to append milliseconds.
+    :return: Local time string HH:MM:SS, or HH:MM:SS.mmm with millis.
+    """
+    second = int(request_time)
+    if second != _TIME_CACHE[0]:
+        lt = time.localtime(second)
+        _TIME_CACHE[:] = [second, f"{lt.tm_hour:02d}:{lt.tm_min:02d}:{lt.tm_sec:02d}"]
+    if millis:
+        return f"{_TIME_CACHE[1]}.{int(request_time * 1000) % 1000:03d}"
+    return _TIME_CACHE[1]
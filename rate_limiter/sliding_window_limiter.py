@@ -1,11 +1,58 @@
+import hashlib
+import orjson
 import redis
 import time
-import json
-from datetime import datetime
-from base_limiter import BaseLimiter
 
-
-class SlidingWindowLimiter(BaseLimiter):
+from redis_pool import format_time, get_pool, run_script
+
+
+# Expire old timestamps once, then count + conditional add + history append
+# for each request of a batch, executed atomically in one round-trip.
+# Sorted set members are ids from an INCR sequence, so requests with the
+# same timestamp never collide.
+# KEYS: [timestamps_key, history_key, seq_key]
+# ARGV: [now, window_size, max_requests, key_ttl_seconds, time_str, client_id_1, client_id_2, ...]
+# Returns: [removed_requests, allowed_1, window_requests_1, allowed_2, ...]
+_IS_ALLOWED_LUA = """
+local now = tonumber(ARGV[1])
+local removed = redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - tonumber(ARGV[2]))
+local count = redis.call('ZCARD', KEYS[1])
+local max_requests = tonumber(ARGV[3])
+local added = false
+local results = {removed}
+for i = 6, #ARGV do
+    local allowed = 0
+    if count < max_requests then
+        redis.call('ZADD', KEYS[1], now, redis.call('INCR', KEYS[3]))
+        count = count + 1
+        allowed = 1
+        added = true
+    end
+    redis.call('LPUSH', KEYS[2], cjson.encode({
+        time = ARGV[5],
+        user = ARGV[i],
+        status = allowed == 1 and '成功' or '拒絕',
+        count_after = count,
+        timestamp = now,
+        algorithm = 'sliding_window'
+    }))
+    results[#results + 1] = allowed
+    results[#results + 1] = count
+end
+-- Set expiration to prevent data accumulation; only new timestamps extend it
+if added then
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    redis.call('EXPIRE', KEYS[3], ARGV[4])
+end
+redis.call('LTRIM', KEYS[2], 0, 49)
+return results
+"""
+
+# EVALSHA digest of the script, shared by all instances; loaded on first NOSCRIPT
+_IS_ALLOWED_SHA = hashlib.sha1(_IS_ALLOWED_LUA.encode()).hexdigest()
+
+
+class SlidingWindowLimiter:
     """
     Sliding Window Rate Limiter implementation using Redis.
 
@@ -27,109 +74,84 @@ class SlidingWindowLimiter(BaseLimiter):
         """
         self.max_requests = max_requests
         self.window_size = window_size
-        self.redis_client = redis_client or redis.Redis(
-            host='redis',
-            port=6379,
-            db=0,
-            decode_responses=True
-        )
+        self.redis_client = redis_client or redis.Redis(connection_pool=get_pool())
 
         self.timestamps_key = "sliding_window_timestamps"
         self.history_key = "sliding_window_history"
+        self.seq_key = "sliding_window_seq"
 
-    def _remove_old_requests(self):
+    def is_allowed(self, client_id, cost=1):
         """
-        Remove requests that are outside the current sliding window.
-
-        Uses Redis ZREMRANGEBYSCORE to efficiently remove timestamps
-        older than (current_time - window_size).
+        Check if a request is allowed based on sliding window rate limiting.
+        See is_allowed_batch() for the algorithm.
 
-        :return: Number of removed requests.
+        :param client_id: The client identifier for logging.
+        :param cost: Ignored; every request counts once toward the window.
+        :return: Tuple (allowed: bool, info: dict with window info).
         """
-        current_time = time.time()
-        clean_threshold = current_time - self.window_size
+        return self.is_allowed_batch([(client_id, cost)])[0]
 
-        # Remove all timestamps older than the window
-        removed_count = self.redis_client.zremrangebyscore(
-            self.timestamps_key, 0, clean_threshold
-        )
-
-        # Set expiration to prevent data accumulation
-        if self.redis_client.exists(self.timestamps_key):
-            self.redis_client.expire(self.timestamps_key, int(self.window_size * 2))
-
-        return removed_count
-
-    def is_allowed(self, client_id):
+    def is_allowed_batch(self, requests):
         """
-        Check if a request is allowed based on sliding window rate limiting.
+        Check several requests, in order, with a single Redis round-trip.
 
-        Algorithm:
+        Algorithm (run atomically in one Lua script):
         1. Remove expired requests from the sliding window
-        2. Check current request count in window
-        3. If under limit, add current request timestamp
+        2. For each request, check current request count in window
+        3. If under limit, add the request timestamp
         4. Record request history
 
-        :param client_id: The client identifier for logging.
-        :return: Tuple (allowed: bool, info: dict with window info).
+        :param requests: Iterable of (client_id, cost) tuples; cost is ignored,
+                         every request counts once toward the window.
+        :return: List of (allowed: bool, info: dict with window info) tuples in request order.
         """
         current_time = time.time()
-        removed_count = self._remove_old_requests()
-        current_count = self.redis_client.zcard(self.timestamps_key)
 
-        if current_count < self.max_requests:
-            unique_timestamp = f"{current_time:.6f}_{client_id}_{time.time_ns()}"
-            self.redis_client.zadd(self.timestamps_key, {unique_timestamp: current_time})
-
-            allowed = True
-            final_count = self.redis_client.zcard(self.timestamps_key)
-        else:
-            allowed = False
-            final_count = current_count
-
-        self._add_history_to_redis(client_id, allowed, final_count, current_time)
-
-        return allowed, {
-            'window_requests': final_count,
-            'removed_requests': removed_count
-        }
-
-    def _add_history_to_redis(self, client_id, allowed, count, request_time):
-        """
-        Add request history to shared Redis storage.
-        :param client_id: Client identifier.
-        :param allowed: Whether request was allowed.
-        :param count: Current request count in window.
-        :param request_time: Timestamp of the request.
-        """
-        history_record = {
-            'time': datetime.fromtimestamp(request_time).strftime('%H:%M:%S'),
-            'user': client_id,
-            'status': '成功' if allowed else '拒絕',
-            'count_after': count,
-            'timestamp': request_time,
-            'algorithm': 'sliding_window'
-        }
-
-        # Add to Redis list (newest first)
-        self.redis_client.lpush(self.history_key, json.dumps(history_record))
-
-        self.redis_client.ltrim(self.history_key, 0, 49)
+        args = [
+            current_time,
+            self.window_size,
+            self.max_requests,
+            int(self.window_size * 2),
+            format_time(current_time)
+        ]
+        args.extend(client_id for client_id, _ in requests)
+        if len(args) == 5:
+            return []
+
+        results = run_script(self.redis_client, _IS_ALLOWED_SHA, _IS_ALLOWED_LUA,
+                             (self.timestamps_key, self.history_key, self.seq_key), args)
+        removed_count = results[0]
+
+        # Expired timestamps are removed before the first request only
+        return [
+            (bool(results[i]), {
+                'window_requests': results[i + 1],
+                'removed_requests': removed_count if i == 1 else 0
+            })
+            for i in range(1, len(results), 2)
+        ]
 
     @property
     def request_history(self):
         """
         Get shared request history from Redis.
-        :return: List of recent request records.
+        :return: List of the 20 most recent request records.
+        """
+        return self.get_history()
+
+    def get_history(self, limit=20):
+        """
+        Get the most recent request records from Redis.
+        :param limit: Maximum number of records to fetch.
+        :return: List of recent request records, newest first.
         """
-        history_data = self.redis_client.lrange(self.history_key, 0, 19)
+        history_data = self.redis_client.lrange(self.history_key, 0, limit - 1)
         history_list = []
 
         for record_json in history_data:
             try:
-                record = json.loads(record_json)
-                history_list.append(record)
-            except json.JSONDecodeError:
+                history_list.append(orjson.loads(record_json))
+            except orjson.JSONDecodeError:
                 continue
 
         return history_list
@@ -138,17 +160,16 @@ class SlidingWindowLimiter(BaseLimiter):
         """
         Get current sliding window status.
 
-        Always returns up-to-date information by cleaning expired
-        requests before calculating current state.
+        Always returns up-to-date information by counting only requests
+        inside the window; expired timestamps are left for is_allowed to
+        remove, so status reads do not write to Redis.
 
         :return: Dictionary containing current status information.
         """
         current_time = time.time()
 
         clean_threshold = current_time - self.window_size
-        self.redis_client.zremrangebyscore(self.timestamps_key, 0, clean_threshold)
-
-        total_requests = self.redis_client.zcard(self.timestamps_key)
+        total_requests = self.redis_client.zcount(self.timestamps_key, f"({clean_threshold}", "+inf")
 
         return {
             'current_count': total_requests,
@@ -171,7 +192,6 @@ class SlidingWindowLimiter(BaseLimiter):
     def reset(self):
         """
         Reset sliding window rate limiter state.
-        Clears all stored timestamps and history records.
+        Clears all stored timestamps, the member sequence and history records.
         """
-        self.redis_client.delete(self.timestamps_key)
-        self.redis_client.delete(self.history_key)
+        self.redis_client.delete(self.timestamps_key, self.seq_key, self.history_key)
@@ -1,11 +1,57 @@
+import hashlib
+import orjson
 import redis
 import time
-import json
-from datetime import datetime
-from base_limiter import BaseLimiter
 
-
-class TokenBucketLimiter(BaseLimiter):
+from redis_pool import format_time, get_pool, run_script
+
+
+# Refill once, then token check + history append for each (client_id, cost)
+# pair of a batch, then state write, executed atomically in one round-trip.
+# Bucket state is one hash: tokens = current tokens, last = last refill time.
+# A missing hash is a full bucket.
+# KEYS: [state_key, history_key]
+# ARGV: [now, refill_rate, capacity, time_str, client_id_1, cost_1, ...]
+# Returns: [allowed_1, tokens_1, allowed_2, tokens_2, ...]
+_IS_ALLOWED_LUA = """
+local now = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'last')
+local tokens = tonumber(state[1] or ARGV[3])
+local last_refill = tonumber(state[2] or ARGV[1])
+-- A wall-clock step backwards must not drain the bucket
+local elapsed = math.max(0, now - last_refill)
+tokens = math.min(capacity, tokens + elapsed * tonumber(ARGV[2]))
+local results = {}
+for i = 5, #ARGV, 2 do
+    local cost = tonumber(ARGV[i + 1])
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('LPUSH', KEYS[2], cjson.encode({
+        time = ARGV[4],
+        user = ARGV[i],
+        status = allowed == 1 and '成功' or '拒絕',
+        count_after = math.floor(tokens * 100 + 0.5) / 100,
+        cost = cost,
+        timestamp = now,
+        algorithm = 'token_bucket'
+    }))
+    results[#results + 1] = allowed
+    results[#results + 1] = tostring(tokens)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'last', ARGV[1])
+redis.call('LTRIM', KEYS[2], 0, 49)
+return results
+"""
+
+# EVALSHA digest of the script, shared by all instances; loaded on first NOSCRIPT
+_IS_ALLOWED_SHA = hashlib.sha1(_IS_ALLOWED_LUA.encode()).hexdigest()
+
+
+class TokenBucketLimiter:
     """
     Token Bucket Rate Limiter implementation using Redis.
 
@@ -30,126 +76,103 @@ class TokenBucketLimiter(BaseLimiter):
         """
         self.capacity = capacity
         self.refill_rate = refill_rate
-        self.redis_client = redis_client or redis.Redis(
-            host='redis',
-            port=6379,
-            db=0,
-            decode_responses=True
-        )
-
-        self.tokens_key = "token_bucket_tokens"
-        self.last_refill_key = "token_bucket_last_refill"
-        self.history_key = "token_bucket_history"
-
-        self._initialize_bucket()
+        self.redis_client = redis_client or redis.Redis(connection_pool=get_pool())
 
-    def _initialize_bucket(self):
-        """
-        Initialize Token Bucket state in Redis.
-        Sets bucket to full capacity if no previous state exists.
-        """
-        if not self.redis_client.exists(self.tokens_key):
-            self.redis_client.set(self.tokens_key, self.capacity)
-            self.redis_client.set(self.last_refill_key, time.time())
+        # Hash with tokens and last refill time; created full on first use
+        self.state_key = "token_bucket:state"
+        self.history_key = "token_bucket_history"
 
-    def _refill_tokens(self):
+    def _compute_current_tokens(self, now=None):
         """
-        Refill tokens based on time elapsed since last refill.
+        Compute the current number of tokens without writing to Redis.
 
-        Algorithm:
-        1. Calculate time passed since last refill
+        Applies the refill since the last stored update locally, so status
+        reads cost one HMGET and leave the stored state untouched; only
+        is_allowed persists the refill:
+        1. Calculate time passed since last refill (never negative)
         2. Calculate tokens to add (time_passed * refill_rate)
         3. Add tokens up to bucket capacity
-        4. Update Redis with new token count and refill time
 
+        :param now: Timestamp to compute at; read from the clock if omitted.
         :return: Current number of tokens after refill.
         """
-        current_time = time.time()
-
-        current_tokens = float(self.redis_client.get(self.tokens_key) or 0)
-        last_refill_time = float(self.redis_client.get(self.last_refill_key) or current_time)
-
-        time_passed = current_time - last_refill_time
-        tokens_to_add = time_passed * self.refill_rate
-        new_tokens = min(self.capacity, current_tokens + tokens_to_add)
+        if now is None:
+            now = time.time()
 
-        self.redis_client.set(self.tokens_key, new_tokens)
-        self.redis_client.set(self.last_refill_key, current_time)
+        tokens, last_refill = self.redis_client.hmget(self.state_key, 'tokens', 'last')
+        if tokens is None:
+            return float(self.capacity)
 
-        return new_tokens
+        # A wall-clock step backwards must not drain the bucket
+        time_passed = max(0.0, now - float(last_refill))
+        return min(self.capacity, float(tokens) + time_passed * self.refill_rate)
 
     def is_allowed(self, client_id, cost=1):
         """
         Check if a request is allowed based on available tokens.
+        See is_allowed_batch() for the algorithm.
+
+        :param client_id: The client identifier for logging.
+        :param cost: Number of tokens required for this request.
+        :return: Tuple (allowed: bool, info: dict with token info).
+        """
+        return self.is_allowed_batch([(client_id, cost)])[0]
+
+    def is_allowed_batch(self, requests):
+        """
+        Check several requests, in order, with a single Redis round-trip.
 
-        Algorithm:
+        Algorithm (run atomically in one Lua script):
         1. Refill tokens based on elapsed time
-        2. Check if sufficient tokens are available
+        2. For each request, check if sufficient tokens are available
         3. If yes, consume tokens and allow request
         4. If no, reject request (tokens remain unchanged)
         5. Record request history
 
-        :param client_id: The client identifier for logging.
-        :param cost: Number of tokens required for this request.
-        :return: Tuple (allowed: bool, info: dict with token info).
+        :param requests: Iterable of (client_id, cost) tuples.
+        :return: List of (allowed: bool, info: dict with token info) tuples in request order.
         """
         current_time = time.time()
-        current_tokens = self._refill_tokens()
-
-        if current_tokens >= cost:
-            new_tokens = current_tokens - cost
-            self.redis_client.set(self.tokens_key, new_tokens)
-            allowed = True
-            final_tokens = new_tokens
-        else:
-            allowed = False
-            final_tokens = current_tokens
-
-        self._add_history_to_redis(client_id, allowed, final_tokens, cost, current_time)
-
-        return allowed, {
-            'cost': cost if allowed else 0,
-            'tokens_remaining': final_tokens
-        }
 
-    def _add_history_to_redis(self, client_id, allowed, tokens_after, cost, request_time):
-        """
-        Add request history to shared Redis storage.
-        :param client_id: Client identifier.
-        :param allowed: Whether request was allowed.
-        :param tokens_after: Number of tokens remaining after request.
-        :param cost: Number of tokens requested.
-        :param request_time: Timestamp of the request.
-        """
-        history_record = {
-            'time': datetime.fromtimestamp(request_time).strftime('%H:%M:%S'),
-            'user': client_id,
-            'status': '成功' if allowed else '拒絕',
-            'count_after': round(tokens_after, 2),
-            'cost': cost,
-            'timestamp': request_time,
-            'algorithm': 'token_bucket'
-        }
+        args = [current_time, self.refill_rate, self.capacity, format_time(current_time)]
+        for client_id, cost in requests:
+            args.extend((client_id, cost))
+        if len(args) == 4:
+            return []
 
-        # Add to Redis list (newest first)
-        self.redis_client.lpush(self.history_key, json.dumps(history_record))
+        results = run_script(self.redis_client, _IS_ALLOWED_SHA, _IS_ALLOWED_LUA,
+                             (self.state_key, self.history_key), args)
 
-        self.redis_client.ltrim(self.history_key, 0, 49)
+        parsed = []
+        for i in range(0, len(results), 2):
+            allowed = bool(results[i])
+            parsed.append((allowed, {
+                'cost': args[i + 5] if allowed else 0,
+                'tokens_remaining': float(results[i + 1])
+            }))
+        return parsed
 
     @property
     def request_history(self):
         """
         Get shared request history from Redis.
-        :return: List of recent request records.
+        :return: List of the 20 most recent request records.
+        """
+        return self.get_history()
+
+    def get_history(self, limit=20):
+        """
+        Get the most recent request records from Redis.
+        :param limit: Maximum number of records to fetch.
+        :return: List of recent request records, newest first.
         """
-        history_data = self.redis_client.lrange(self.history_key, 0, 19)
+        history_data = self.redis_client.lrange(self.history_key, 0, limit - 1)
         history_list = []
 
         for record_json in history_data:
             try:
-                record = json.loads(record_json)
-                history_list.append(record)
-            except json.JSONDecodeError:
+                history_list.append(orjson.loads(record_json))
+            except orjson.JSONDecodeError:
                 continue
 
         return history_list
@@ -157,11 +180,11 @@ class TokenBucketLimiter(BaseLimiter):
     def get_status(self):
         """
         Get current token bucket status.
-        Automatically refills tokens and returns current state.
+        Applies the refill locally (read-only) and returns current state.
 
         :return: Dictionary containing current status information.
         """
-        current_tokens = self._refill_tokens()
+        current_tokens = self._compute_current_tokens()
         tokens_needed_to_fill = self.capacity - current_tokens
         time_to_fill = tokens_needed_to_fill / self.refill_rate if self.refill_rate > 0 else 0
 
@@ -176,18 +199,17 @@ class TokenBucketLimiter(BaseLimiter):
     def reset(self):
         """
         Reset Token Bucket state to full capacity.
-        Clears all stored tokens and history records.
+        Clears all stored tokens and history records; a missing state hash
+        is treated as a full bucket.
         """
-        self.redis_client.set(self.tokens_key, self.capacity)
-        self.redis_client.set(self.last_refill_key, time.time())
-        self.redis_client.delete(self.history_key)
+        self.redis_client.unlink(self.state_key, self.history_key)
 
     def get_bucket_visualization(self):
         """
         Get visual representation of current bucket state.
         :return: Dictionary with visualization data.
         """
-        current_tokens = self._refill_tokens()
+        current_tokens = self._compute_current_tokens()
         fill_percentage = (current_tokens / self.capacity) * 100
 
         filled_blocks = int((current_tokens / self.capacity) * 10)